@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from uplift.tree import DecisionTreeRegressor
+from uplift.tree._tree import Tree
+
+
+def _stump(threshold):
+    tree = Tree(n_groups=1)
+    tree.add_node(None, True, False, 0.0, 1.0, (0, threshold),
+                  ((1,), 1, (0.0,)))
+    tree.add_node(0, True, True, 0.0, None, (None, None),
+                  ((1,), 1, (1.0,)))
+    tree.add_node(0, False, True, 0.0, None, (None, None),
+                  ((1,), 1, (2.0,)))
+    return tree
+
+
+@pytest.mark.parametrize('threshold', [-2.5, -0.5, 0.5, 2.5])
+@pytest.mark.parametrize('dtype', [np.int32, np.int64])
+def test_apply_paths_agree_on_integer_input(threshold, dtype):
+    X = np.arange(-4, 5, dtype=dtype).reshape(-1, 1)
+    tree = _stump(threshold)
+
+    expected = np.where(X <= threshold, 1.0, 2.0)
+
+    np.testing.assert_array_equal(tree.apply(X), expected)
+    np.testing.assert_array_equal(tree.apply_batched(X), expected)
+    np.testing.assert_array_equal(tree.apply_compiled(X), expected)
+
+
+def test_predict_integer_input_matches_float_input():
+    rng = np.random.RandomState(0)
+    n_samples = 3000
+
+    X = rng.uniform(-20, 20, size=(n_samples, 3))
+    w = rng.randint(0, 2, n_samples)
+    y = (X[:, 0] > 0) * w + rng.rand(n_samples)
+
+    tree = DecisionTreeRegressor(max_depth=4,
+                                 max_bins=16,
+                                 random_state=0).fit(X, y, w)
+
+    X_int = np.round(X).astype(np.int64)
+    np.testing.assert_array_equal(tree.predict(X_int),
+                                  tree.predict(X_int.astype(np.float64)))
+
+    # Batches of at most 256 rows go through the compiled path.
+    np.testing.assert_array_equal(tree.predict(X_int[:250]),
+                                  tree.predict(X_int[:250].astype(np.float64)))
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_binned_leaf_counts_match_predict_routing(dtype):
+    rng = np.random.RandomState(0)
+    n_samples = 3000
+
+    # Values near 2**23 are integers in float32, so a bin edge that falls
+    # between two of them would be rounded onto one at predict time.
+    X = (2 ** 23 + rng.randint(0, 4096, size=(n_samples, 3))).astype(dtype)
+    w = rng.randint(0, 2, n_samples)
+    y = (X[:, 0] > 2 ** 23 + 2048) * w + rng.rand(n_samples)
+
+    tree = DecisionTreeRegressor(max_depth=4,
+                                 max_bins=64,
+                                 random_state=0).fit(X, y, w)
+
+    # Label each leaf with its own id so that predict reports the leaf each
+    # sample is routed to. The identity threshold map drops cached arrays.
+    tree_ = tree.tree_
+    for leaf_id in tree_.leaf_ids:
+        tree_.nodes[leaf_id][-1] = (float(leaf_id),)
+    tree_.map_thresholds(lambda feature, threshold: threshold)
+
+    expected = [sum(tree_.nodes[leaf_id][8]) + tree_.nodes[leaf_id][9]
+                for leaf_id in tree_.leaf_ids]
+
+    for X_pred in (X, X.astype(np.float64)):
+        leaf_ids = tree.predict(X_pred)
+        counts = [(leaf_ids == leaf_id).sum() for leaf_id in tree_.leaf_ids]
+        np.testing.assert_array_equal(counts, expected)
+
+    # Batches of at most 256 rows go through the compiled path.
+    np.testing.assert_array_equal(tree.predict(X[:250]),
+                                  tree.predict(X[:250].astype(np.float64)))
+
+
+def _fit_many_data():
+    rng = np.random.RandomState(0)
+    n_samples = 1000
+
+    X = np.round(rng.uniform(-1, 1, size=(n_samples, 4)), 1)
+    w = rng.randint(0, 2, n_samples)
+    y = (X[:, 0] > 0) * w + rng.rand(n_samples)
+    return X, y, w
+
+
+@pytest.mark.parametrize('max_bins', [None, 16])
+def test_fit_many_without_bootstrap_matches_fit(max_bins):
+    X, y, w = _fit_many_data()
+
+    trees = DecisionTreeRegressor.fit_many(X, y, w, 3,
+                                           bootstrap=False,
+                                           random_state=0,
+                                           max_depth=4,
+                                           max_features=2,
+                                           max_bins=max_bins,
+                                           n_jobs=2)
+
+    for tree in trees:
+        expected = DecisionTreeRegressor(max_depth=4,
+                                         max_features=2,
+                                         max_bins=max_bins,
+                                         random_state=tree.random_state).fit(X, y, w)
+        assert tree.n_jobs == 2
+        np.testing.assert_array_equal(tree.predict(X), expected.predict(X))
+
+
+@pytest.mark.parametrize('max_bins', [None, 16])
+def test_fit_many_is_reproducible(max_bins):
+    X, y, w = _fit_many_data()
+
+    def fit_many(n_jobs_trees):
+        return DecisionTreeRegressor.fit_many(X, y, w, 4,
+                                              n_jobs_trees=n_jobs_trees,
+                                              random_state=0,
+                                              max_depth=4,
+                                              max_features=2,
+                                              max_bins=max_bins)
+
+    for first, second in zip(fit_many(None), fit_many(2)):
+        np.testing.assert_array_equal(first.predict(X), second.predict(X))
@@ -1,38 +1,47 @@
-from abc import ABCMeta, abstractmethod
+from abc import ABCMeta
 
 import numpy as np
 from joblib import Parallel, delayed
-from sklearn.base import is_classifier
-from sklearn.utils import check_X_y, check_scalar, check_random_state
+from sklearn import config_context
+from sklearn.utils import check_scalar
 from sklearn.ensemble import BaseEnsemble
 from sklearn.utils.validation import check_is_fitted
 
 from .base import BaseEstimator, RegressorMixin, ClassifierMixin
 from .tree import DecisionTreeRegressor, DecisionTreeClassifier
+from .utils import check_random_state
 
 
-def _generate_indexes(source_size, sample_size):
-    return np.random.choice(np.arange(source_size),
-                            sample_size,
-                            replace=True)
+def _generate_indexes(random_state, source_size, sample_size):
+    return random_state.choice(np.arange(source_size),
+                               sample_size,
+                               replace=True)
 
 
 def _parallel_fit(tree, X, y, w, max_samples, max_features):
     n_samples, n_features = X.shape
 
-    samples_idx = _generate_indexes(n_samples, max_samples)
+    # Trees are fitted on threads, so sampling must not touch the global
+    # numpy random state.
+    random_state = check_random_state(tree.random_state)
+
+    samples_idx = _generate_indexes(random_state, n_samples, max_samples)
     if max_features < n_features: 
-        features_idx = _generate_indexes(n_features, max_features)
+        features_idx = _generate_indexes(random_state, n_features, max_features)
+        X_sample = X[np.ix_(samples_idx, features_idx)]
     else:
-        features_idx = np.arange(n_features)
+        X_sample = X[samples_idx]
 
-    tree.fit(X[samples_idx, :][:, features_idx], y[samples_idx], w[samples_idx])
+    # X was validated by the forest already, so the tree skips the second
+    # scan for infinite values.
+    with config_context(assume_finite=True):
+        tree.fit(X_sample, y[samples_idx], w[samples_idx])
 
     return tree
 
 
 def _parallel_predict(tree, X):
-    return tree.predict(X)
+    return tree.predict(X, assume_valid=True)
 
 
 class BaseForest(BaseEnsemble, BaseEstimator, metaclass=ABCMeta):
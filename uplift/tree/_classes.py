@@ -1,14 +1,18 @@
 import numbers
 from abc import ABCMeta, abstractmethod
+from math import isqrt
 
 import numpy as np
-from sklearn.base import BaseEstimator, is_classifier
-from sklearn.utils import check_random_state, check_scalar
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.utils import check_scalar
 from sklearn.utils.validation import check_is_fitted
 
 from . import _criterion, _splitter
-from ._tree import Tree, DepthFirstTreeBuilder, BestFirstTreeBuilder
+from ._tree import TreeParams, fit_tree
+from ._utils import QuantileBinner
 from ..base import BaseEstimator, ClassifierMixin, RegressorMixin
+from ..utils import check_random_state
 
 
 _criteria_clf = {'delta_delta_p': _criterion.DeltaDeltaP,
@@ -20,8 +24,19 @@ _criteria_reg = {'delta_delta_p': _criterion.DeltaDeltaP,}
 _splitters = {'best': _splitter.BestSplitter,
               'fast': _splitter.FastSplitter,}
 
+_MAX_FEATURES_FNS = {'auto': lambda n, is_clf: max(1, isqrt(n)) if is_clf else n,
+                     'sqrt': lambda n, _: max(1, isqrt(n)),
+                     'log2': lambda n, _: max(1, n.bit_length() - 1),}
+
+# Small batches are cheaper to route sample by sample than level by level.
+_BATCHED_MIN_SAMPLES = 256
+
 
 class BaseDecisionTree(BaseEstimator, metaclass=ABCMeta):
+    _CRITERION_TABLE = {}
+    _SPLITTER_TABLE = _splitters
+    _is_classification = False
+
     @abstractmethod
     def __init__(self,
                  *,
@@ -34,7 +49,9 @@ class BaseDecisionTree(BaseEstimator, metaclass=ABCMeta):
                  min_samples_leaf_control: int,
                  max_features: int,
                  max_leaf_nodes: int,
-                 random_state: int, ):
+                 random_state: int,
+                 max_bins: int,
+                 n_jobs: int, ):
         self.criterion = criterion
         self.splitter = splitter
         self.max_depth = max_depth
@@ -45,13 +62,88 @@ class BaseDecisionTree(BaseEstimator, metaclass=ABCMeta):
         self.max_features = max_features
         self.max_leaf_nodes = max_leaf_nodes
         self.random_state = random_state
+        self.max_bins = max_bins
+        self.n_jobs = n_jobs
 
     def fit(self, X, y, w):
         X, y, w = self._validate_data(X, y, w, reset=True,
                                       force_all_finite='allow-nan')
 
-        is_classification = is_classifier(self)
+        params = self._resolve_params(self.n_features_in_)
+
+        binner = None
+        if params.max_bins is not None:
+            binner = QuantileBinner(n_bins=params.max_bins).fit(X)
+            X = binner.transform(X)
+
+        return self._fit_validated(X, y, w, params, binner)
+
+    @classmethod
+    def fit_many(cls, X, y, w, n_trees, *,
+                 bootstrap=True, n_jobs_trees=None, random_state=None,
+                 **kwargs):
+        # X is validated and binned once and shared by all the trees, which
+        # are then built on bootstrap samples of its rows. ``n_jobs_trees``
+        # sets how many trees are built at once; ``n_jobs`` in kwargs is
+        # passed on to each tree's splitter.
+        template = cls(**kwargs)
+        X, y, w = template._validate_data(X, y, w, reset=True,
+                                          force_all_finite='allow-nan')
+
+        params = template._resolve_params(template.n_features_in_)
+
+        binner = None
+        if params.max_bins is not None:
+            binner = QuantileBinner(n_bins=params.max_bins).fit(X)
+            X = binner.transform(X)
+
+        random_state = check_random_state(random_state)
+        seeds = random_state.choice(np.iinfo(np.int32).max, n_trees)
+
+        def fit_one(seed):
+            tree = clone(template).set_params(random_state=seed)
+            for attr in ('n_features_in_', 'feature_names_in_', 'groups', 'n_groups'):
+                if hasattr(template, attr):
+                    setattr(tree, attr, getattr(template, attr))
+
+            if bootstrap:
+                n_samples = X.shape[0]
+                idx = check_random_state(seed).choice(n_samples, n_samples,
+                                                      replace=True)
+                return tree._fit_validated(X[idx], y[idx], w[idx],
+                                           params, binner)
+            return tree._fit_validated(X, y, w, params, binner)
+
+        return Parallel(n_jobs=n_jobs_trees,
+                        prefer='threads',)(delayed(fit_one)(seed)
+                                           for seed in seeds)
+
+    def _fit_validated(self, X, y, w, params, binner):
+        criterion_cls, splitter_cls = self._resolve_components()
+
+        random_state = check_random_state(self.random_state)
+
+        self.tree_ = fit_tree(X, y, w, self.groups, self.n_groups,
+                              params, criterion_cls, splitter_cls,
+                              random_state, self.n_jobs)
+        if binner is not None:
+            self.tree_.map_thresholds(binner.threshold)
 
+        return self
+
+    def _resolve_components(self):
+        try:
+            criterion_cls = self._CRITERION_TABLE[self.criterion]
+        except KeyError:
+            raise ValueError("Invalid value for criterion") from None
+        try:
+            splitter_cls = self._SPLITTER_TABLE[self.splitter]
+        except KeyError:
+            raise ValueError("Invalid value for splitter") from None
+
+        return criterion_cls, splitter_cls
+
+    def _resolve_params(self, n_features):
         max_depth = np.iinfo(np.int32).max if self.max_depth is None else self.max_depth
         max_leaf_nodes = -1 if self.max_leaf_nodes is None else self.max_leaf_nodes
 
@@ -82,76 +174,73 @@ class BaseDecisionTree(BaseEstimator, metaclass=ABCMeta):
         min_samples_split = max(min_samples_split, 2 * min_samples_leaf)
 
         if isinstance(self.max_features, str):
-            if self.max_features == "auto":
-                if is_classification:
-                    max_features = max(1, int(np.sqrt(self.n_features_in_)))
-                else:
-                    max_features = self.n_features_in_
-            elif self.max_features == "sqrt":
-                max_features = max(1, int(np.sqrt(self.n_features_in_)))
-            elif self.max_features == "log2":
-                max_features = max(1, int(np.log2(self.n_features_in_)))
-            else:
-                raise ValueError("Invalid value for max_features")
+            try:
+                max_features_fn = _MAX_FEATURES_FNS[self.max_features]
+            except KeyError:
+                raise ValueError("Invalid value for max_features") from None
+            max_features = max_features_fn(n_features, self._is_classification)
         elif self.max_features is None:
-            max_features = self.n_features_in_
+            max_features = n_features
         elif isinstance(self.max_features, numbers.Integral):
             max_features = self.max_features
         else:  # float
             if self.max_features > 0.0:
-                max_features = max(1, int(self.max_features * self.n_features_in_))
+                max_features = max(1, int(self.max_features * n_features))
             else:
                 max_features = 0
 
-        random_state = check_random_state(self.random_state)
-
-        if is_classification:
-            criterion = _criteria_clf[self.criterion](self.groups)
-        else:
-            criterion = _criteria_reg[self.criterion](self.groups)
-
-        splitter = _splitters[self.splitter](criterion,
-                                             min_samples_leaf,
-                                             min_samples_leaf_treated,
-                                             min_samples_leaf_control,
-                                             max_features,
-                                             random_state)
-
-        self.tree_ = Tree(n_groups=self.n_groups)
-        if max_leaf_nodes < 0:
-            builder = DepthFirstTreeBuilder(splitter,
-                                            max_depth,
-                                            min_samples_split,
-                                            min_samples_leaf,
-                                            min_samples_leaf_treated,
-                                            min_samples_leaf_control,)
+        if self.max_bins is None:
+            max_bins = None
         else:
-            builder = BestFirstTreeBuilder(splitter,
-                                           max_depth,
-                                           min_samples_split,
-                                           min_samples_leaf,
-                                           min_samples_leaf_treated,
-                                           min_samples_leaf_control,
-                                           max_leaf_nodes,)
+            max_bins = check_scalar(self.max_bins,
+                                    'max_bins',
+                                    int,
+                                    min_val=2,
+                                    max_val=255,)
 
-        builder.build(self.tree_, X, y, w, self.groups)
+        params = TreeParams(max_depth=max_depth,
+                            min_samples_split=min_samples_split,
+                            min_samples_leaf=min_samples_leaf,
+                            min_samples_leaf_treated=min_samples_leaf_treated,
+                            min_samples_leaf_control=min_samples_leaf_control,
+                            max_features=max_features,
+                            max_leaf_nodes=max_leaf_nodes,
+                            max_bins=max_bins,)
+        return params
 
-        return self
-
-    def predict(self, X):
+    def predict(self, X, assume_valid=False):
         check_is_fitted(self)
 
-        X = self._validate_data(X, reset=False,
-                                force_all_finite='allow-nan')
+        # With ``assume_valid`` the caller guarantees X holds no infinite
+        # values, so a well-formed array is passed to the tree as is.
+        if not (assume_valid and self._is_valid_input(X)):
+            X = self._validate_data(X, reset=False,
+                                    force_all_finite='allow-nan')
+        if X.shape[0] > _BATCHED_MIN_SAMPLES:
+            uplift = self.tree_.apply_batched(X)
+        else:
+            uplift = self.tree_.apply_compiled(X)
+
         if self.n_groups == 1:
-            return self.tree_.apply(X).reshape(-1)
-        return self.tree_.apply(X)
+            return uplift.reshape(-1)
+        return uplift
+
+    def _is_valid_input(self, X):
+        return (isinstance(X, np.ndarray)
+                and X.dtype in (np.float32, np.float64)
+                and X.ndim == 2
+                and X.flags.c_contiguous
+                and X.shape[1] == self.n_features_in_
+                and not hasattr(self, 'feature_names_in_'))
 
     def _more_tags(self):
         return {'allow_nan': True}
 
 
 class DecisionTreeRegressor(RegressorMixin, BaseDecisionTree):
+    _CRITERION_TABLE = _criteria_reg
+    _is_classification = False
+
     def __init__(self,
                  *,
                  criterion: str = 'delta_delta_p',
@@ -163,7 +252,9 @@ class DecisionTreeRegressor(RegressorMixin, BaseDecisionTree):
                  min_samples_leaf_control: int = 10,
                  max_features: int = None,
                  max_leaf_nodes: int = None,
-                 random_state: int = None):
+                 random_state: int = None,
+                 max_bins: int = None,
+                 n_jobs: int = None):
         super().__init__(criterion=criterion,
                          splitter=splitter,
                          max_depth=max_depth,
@@ -173,10 +264,15 @@ class DecisionTreeRegressor(RegressorMixin, BaseDecisionTree):
                          min_samples_leaf_control=min_samples_leaf_control,
                          max_features=max_features,
                          max_leaf_nodes=max_leaf_nodes,
-                         random_state=random_state)
+                         random_state=random_state,
+                         max_bins=max_bins,
+                         n_jobs=n_jobs)
 
 
 class DecisionTreeClassifier(ClassifierMixin, BaseDecisionTree):
+    _CRITERION_TABLE = _criteria_clf
+    _is_classification = True
+
     def __init__(self,
                  *,
                  criterion: str = 'delta_delta_p',
@@ -188,7 +284,9 @@ class DecisionTreeClassifier(ClassifierMixin, BaseDecisionTree):
                  min_samples_leaf_control: int = 10,
                  max_features: int = None,
                  max_leaf_nodes: int = None,
-                 random_state: int = None):
+                 random_state: int = None,
+                 max_bins: int = None,
+                 n_jobs: int = None):
         super().__init__(criterion=criterion,
                          splitter=splitter,
                          max_depth=max_depth,
@@ -198,4 +296,6 @@ class DecisionTreeClassifier(ClassifierMixin, BaseDecisionTree):
                          min_samples_leaf_control=min_samples_leaf_control,
                          max_features=max_features,
                          max_leaf_nodes=max_leaf_nodes,
-                         random_state=random_state)
+                         random_state=random_state,
+                         max_bins=max_bins,
+                         n_jobs=n_jobs)
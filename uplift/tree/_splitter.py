@@ -1,10 +1,16 @@
 from abc import ABCMeta, abstractmethod
 
 import numpy as np
+from joblib import Parallel, delayed
 
 from ._utils import group_stats
 
 
+# Below this node size the thread pool overhead outweighs the gain from
+# scanning candidate features concurrently.
+_PARALLEL_MIN_SAMPLES = 1 << 14
+
+
 class Splitter(metaclass=ABCMeta):
     def __init__(self,
                  criterion,
@@ -12,20 +18,29 @@ class Splitter(metaclass=ABCMeta):
                  min_samples_leaf_treated,
                  min_samples_leaf_control,
                  max_features,
-                 random_state,):
+                 random_state,
+                 n_jobs=None,):
         self.criterion = criterion
         self.min_samples_leaf = min_samples_leaf
         self.min_samples_leaf_treated = min_samples_leaf_treated
         self.min_samples_leaf_control = min_samples_leaf_control
         self.max_features = max_features
         self.random_state = random_state
+        self.n_jobs = n_jobs
 
     def initialize(self, X, y, w, groups):
-        self.X = X
+        # Split search scans one feature at a time, so columns are kept
+        # contiguous in memory.
+        self.X = np.asfortranarray(X)
         self.y = y
         self.w = w
         self.groups = groups
 
+        # Sorting every column once lets each node read its values in
+        # order instead of sorting them again; NaNs are placed last.
+        self.X_argsorted = np.asfortranarray(np.argsort(self.X, axis=0,
+                                                        kind='stable'))
+
         self.n_features = self.X.shape[1]
         self.constant_features = list()
         self.n_constant_features = 0
@@ -40,8 +55,22 @@ class Splitter(metaclass=ABCMeta):
                                             self.w[idx],
                                             self.groups)
 
+    def sorted_values(self, feature, idx):
+        order = self.X_argsorted[:, feature]
+        return self.X[order[idx[order]], feature]
+
     def thresholds(self, Xi):
-        return np.unique(Xi).tolist()
+        have_nan = np.isnan(Xi[-1]) if len(Xi) != 0 else False
+
+        values = Xi[~np.isnan(Xi)] if have_nan else Xi
+        if len(values) != 0:
+            values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+        thresholds = values.tolist()
+        if have_nan:
+            thresholds = thresholds + [np.nan]
+
+        return thresholds
 
     @abstractmethod
     def split(self, idx, value_parent):
@@ -53,72 +82,92 @@ class Splitter(metaclass=ABCMeta):
         features = [i 
                     for i in range(self.n_features) 
                     if i not in self.constant_features]
-        np.random.shuffle(features)
+        self.random_state.shuffle(features)
 
-        n_visited_features = 0
-        while (n_visited_features < self.max_features
+        candidates = list()
+        while (len(candidates) < self.max_features
                and len(features) != 0):
-            feature = features.pop()
-            
-            Xi = self.X[:, feature]
+            candidates.append(features.pop())
+
+        if (self.n_jobs not in (None, 1)
+            and len(candidates) > 1
+            and idx.sum() >= _PARALLEL_MIN_SAMPLES):
+            results = Parallel(n_jobs=self.n_jobs,
+                               prefer='threads',)(delayed(self.split_feature)(feature,
+                                                                              idx,
+                                                                              value_parent)
+                                                  for feature in candidates)
+        else:
+            results = [self.split_feature(feature, idx, value_parent)
+                       for feature in candidates]
 
-            thresholds = self.thresholds(Xi[idx])
+        for gain, split in results:
+            if gain > best_gain:
+                best_gain = gain
+                best_split = split
 
-            if len(thresholds) == 1:
-                n_visited_features += 1
+        return best_gain, best_split
+
+    def split_feature(self, feature, idx, value_parent):
+        best_split = None
+        best_gain = -np.inf
+
+        Xi = self.X[:, feature]
+
+        thresholds = self.thresholds(self.sorted_values(feature, idx))
+
+        if len(thresholds) == 1:
+            return best_gain, best_split
+
+        for threshold in thresholds:
+            if np.isnan(threshold):
+                idx_left = idx & np.isnan(Xi)
+                idx_right = idx & ~np.isnan(Xi)
+            else:
+                idx_left = idx & (Xi <= threshold)
+                idx_right = idx & (Xi > threshold)
+
+            (nts_left,
+             nc_left, 
+             uplift_left) = group_stats(self.y[idx_left],
+                                        self.w[idx_left],
+                                        self.groups)
+            
+            (nts_right,
+             nc_right, 
+             uplift_right) = group_stats(self.y[idx_right],
+                                         self.w[idx_right],
+                                         self.groups)
+
+            if ((sum(nts_left) + nc_left) < self.min_samples_leaf
+                or (sum(nts_right) + nc_right) < self.min_samples_leaf
+                or min(min(nts_left), min(nts_right)) < self.min_samples_leaf_treated
+                or min(nc_left, nc_right) < self.min_samples_leaf_control):
                 continue
 
-            for threshold in thresholds:
-                if np.isnan(threshold):
-                    idx_left = idx & np.isnan(Xi)
-                    idx_right = idx & ~np.isnan(Xi)
-                else:
-                    idx_left = idx & (Xi <= threshold)
-                    idx_right = idx & (Xi > threshold)
-
-                (nts_left,
-                 nc_left, 
-                 uplift_left) = group_stats(self.y[idx_left],
-                                            self.w[idx_left],
-                                            self.groups)
-                
-                (nts_right,
-                 nc_right, 
-                 uplift_right) = group_stats(self.y[idx_right],
-                                             self.w[idx_right],
-                                             self.groups)
-
-                if ((sum(nts_left) + nc_left) < self.min_samples_leaf
-                    or (sum(nts_right) + nc_right) < self.min_samples_leaf
-                    or min(min(nts_left), min(nts_right)) < self.min_samples_leaf_treated
-                    or min(nc_left, nc_right) < self.min_samples_leaf_control):
-                    continue
-
-                value_left = self.criterion.value(self.y[idx_left],
-                                                  self.w[idx_left])
-                value_right = self.criterion.value(self.y[idx_right],
-                                                   self.w[idx_right])
-
-                gain = self.criterion.gain(value_parent,
-                                           value_left, value_right,
-                                           idx_left.sum(), idx_right.sum())
-
-                if gain > best_gain:
-                    best_gain = gain
-                    best_split = ((feature, threshold),
-                                  tuple([idx_left,
-                                         value_left,
-                                         (nts_left,
-                                          nc_left,
-                                          uplift_left)]),
-                                  tuple([idx_right,
-                                         value_right,
-                                         (nts_right,
-                                          nc_right,
-                                          uplift_right)]))
-
-            n_visited_features += 1
-        
+            value_left = self.criterion.value(self.y[idx_left],
+                                              self.w[idx_left])
+            value_right = self.criterion.value(self.y[idx_right],
+                                               self.w[idx_right])
+
+            gain = self.criterion.gain(value_parent,
+                                       value_left, value_right,
+                                       idx_left.sum(), idx_right.sum())
+
+            if gain > best_gain:
+                best_gain = gain
+                best_split = ((feature, threshold),
+                              tuple([idx_left,
+                                     value_left,
+                                     (nts_left,
+                                      nc_left,
+                                      uplift_left)]),
+                              tuple([idx_right,
+                                     value_right,
+                                     (nts_right,
+                                      nc_right,
+                                      uplift_right)]))
+
         return best_gain, best_split
 
 
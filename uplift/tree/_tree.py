@@ -1,10 +1,37 @@
+import heapq
+import itertools
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
 
 import numpy as np
 
+from ._criterion import DeltaDeltaP
+from ._utils import group_stats
+
 
 _epsilon = np.finfo('double').eps
 
+# The tokenizer rejects source indented more than 100 levels deep; each
+# tree level adds one indentation level to the generated function.
+_MAX_COMPILED_DEPTH = 90
+
+TreeParams = namedtuple('TreeParams', ['max_depth',
+                                       'min_samples_split',
+                                       'min_samples_leaf',
+                                       'min_samples_leaf_treated',
+                                       'min_samples_leaf_control',
+                                       'max_features',
+                                       'max_leaf_nodes',
+                                       'max_bins',])
+
+
+def _comparison_dtype(dtype):
+    # Thresholds are only narrowed to floating inputs; integer X is compared
+    # against float64 thresholds, as numpy does for ``Xi <= threshold``.
+    if np.issubdtype(dtype, np.floating):
+        return np.dtype(dtype)
+    return np.dtype(np.float64)
+
 
 class Tree():
     def __init__(self, n_groups):
@@ -14,6 +41,9 @@ class Tree():
     def reset(self):
         self.nodes = list()
         self.leaf_ids = list()
+        self._arrays = None
+        self._uplift = None
+        self._compiled = None
 
     def add_node(self,
                  parent, is_left, is_leaf,
@@ -34,8 +64,36 @@ class Tree():
         if is_leaf:
             self.leaf_ids.append(node_id)
 
+        self._arrays = None
+        self._uplift = None
+        self._compiled = None
+
         return node_id
 
+    def map_thresholds(self, fn):
+        for node in self.nodes:
+            feature, threshold = node[6:8]
+            if feature is not None:
+                node[7] = fn(feature, threshold)
+
+        self._arrays = None
+        self._uplift = None
+        self._compiled = None
+
+    def _height(self, node_id):
+        height = 0
+        level = [node_id]
+        while len(level) != 0:
+            height += 1
+            level = self._children(level)
+        return height
+
+    def _children(self, node_ids):
+        return [child_id
+                for node_id in node_ids
+                for child_id in self.nodes[node_id][2:4]
+                if child_id is not None]
+
     def apply(self, X) -> np.ndarray:
         n_samples, _ = X.shape
 
@@ -54,6 +112,116 @@ class Tree():
         
         return uplift
 
+    def apply_batched(self, X) -> np.ndarray:
+        feature, threshold, children = self._get_traversal(X.dtype)
+
+        node_ids = np.zeros(X.shape[0], dtype=np.intp)
+        active = np.flatnonzero(children[node_ids, 0] >= 0)
+        while len(active) != 0:
+            active_ids = node_ids[active]
+
+            # ``_apply_node`` compares the left child's value with itself,
+            # so missing values always end up in the left child.
+            Xi = X[active, feature[active_ids]]
+            is_right = ~(np.isnan(Xi) | (Xi <= threshold[active_ids]))
+
+            # The direction indexes the children table directly instead of
+            # selecting between two gathered arrays.
+            node_ids[active] = children[active_ids, is_right.view(np.uint8)]
+            active = active[children[node_ids[active], 0] >= 0]
+
+        return self._get_uplift()[node_ids]
+
+    def apply_compiled(self, X) -> np.ndarray:
+        predict_one = self._get_compiled(X.dtype)
+        if predict_one is None:
+            return self.apply(X)
+
+        node_ids = np.array([predict_one(x) for x in X.tolist()],
+                            dtype=np.intp)
+
+        return self._get_uplift()[node_ids]
+
+    def _get_compiled(self, dtype):
+        # The fitted structure is fixed, so it is unrolled into nested ``if``
+        # statements with the features and thresholds inlined as constants.
+        if self._compiled is None:
+            self._compiled = dict()
+
+        dtype = _comparison_dtype(dtype)
+        if dtype not in self._compiled:
+            if len(self.nodes) == 0 or self._height(0) > _MAX_COMPILED_DEPTH:
+                self._compiled[dtype] = None
+            else:
+                lines = ['def predict_one(x):']
+                self._emit_node(0, dtype.type, 1, lines)
+
+                namespace = {'inf': np.inf}
+                exec(compile('\n'.join(lines), '<uplift.tree>', 'exec'), namespace)
+                self._compiled[dtype] = namespace['predict_one']
+
+        return self._compiled[dtype]
+
+    def _emit_node(self, node_id, cast, depth, lines):
+        indent = '    ' * depth
+        node = self.nodes[node_id]
+        if node[2] is None:
+            lines.append(f'{indent}return {node_id}')
+            return
+
+        # Missing values go to the left child, as in ``apply_batched``.
+        feature, threshold = node[6:8]
+        if np.isnan(threshold):
+            lines.append(f'{indent}if x[{feature}] != x[{feature}]:')
+        else:
+            threshold = float(cast(threshold))
+            lines.append(f'{indent}if not x[{feature}] > {threshold!r}:')
+        self._emit_node(node[2], cast, depth + 1, lines)
+        lines.append(f'{indent}else:')
+        self._emit_node(node[3], cast, depth + 1, lines)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        state['_uplift'] = None
+        state['_compiled'] = None
+        return state
+
+    def _get_traversal(self, dtype):
+        # Only the fields read while routing samples are kept together;
+        # thresholds are cast once per comparison dtype so that comparisons
+        # run at the precision ``_apply_node`` uses for X.
+        if self._arrays is None:
+            self._arrays = dict()
+
+        dtype = _comparison_dtype(dtype)
+
+        if dtype not in self._arrays:
+            n_nodes = len(self.nodes)
+            feature = np.zeros(n_nodes, dtype=np.intp)
+            threshold = np.zeros(n_nodes, dtype=np.float64)
+            children = np.full((n_nodes, 2), -1, dtype=np.intp)
+
+            for node in self.nodes:
+                node_id, left_id, right_id = node[0], node[2], node[3]
+                if left_id is None:
+                    continue
+
+                feature[node_id], threshold[node_id] = node[6:8]
+                children[node_id, :] = left_id, right_id
+
+            self._arrays[dtype] = (feature,
+                                   threshold.astype(dtype, copy=False),
+                                   children)
+
+        return self._arrays[dtype]
+
+    def _get_uplift(self):
+        if self._uplift is None:
+            self._uplift = np.array([node[-1] for node in self.nodes],
+                                    dtype=np.float64).reshape(-1, self.n_groups)
+        return self._uplift
+
     def _apply_node(self, X, parent_id, child_id):
         is_left = self.nodes[parent_id][2] == child_id
         feature, threshold = self.nodes[parent_id][6:8]
@@ -209,18 +377,20 @@ class BestFirstTreeBuilder(TreeBuilder):
         tree.reset()
         self.splitter.initialize(X, y, w, groups)
 
-        stack = list()
-        stack.append((np.full_like(y, True, dtype=bool), 
-                      0,
-                      None,
-                      True,
-                      None,
-                      (None, None, None),))
+        # Frontier nodes are kept in a heap ordered by decreasing value;
+        # the push counter keeps ties in insertion order.
+        heap = list()
+        counter = itertools.count()
+        self._push(heap, counter, (np.full_like(y, True, dtype=bool), 
+                                   0,
+                                   None,
+                                   True,
+                                   None,
+                                   (None, None, None),))
         is_first = True
         max_split_nodes = self.max_leaf_nodes - 1
-        while len(stack) != 0 and max_split_nodes >= 0:
-            next_id = np.array([si[4] for si in stack]).argmax()
-            item = stack.pop(next_id)
+        while len(heap) != 0 and max_split_nodes >= 0:
+            item = heapq.heappop(heap)[2]
 
             gain = None
             feature, threshold = None, None
@@ -266,17 +436,72 @@ class BestFirstTreeBuilder(TreeBuilder):
             if is_leaf:
                 continue
             
-            stack.append((idx_left,
-                          depth + 1,
-                          node_id,
-                          True, 
-                          value_left,
-                          stats_left,))
-            stack.append((idx_right,
-                          depth + 1,
-                          node_id,
-                          False, 
-                          value_right,
-                          stats_right,))
+            self._push(heap, counter, (idx_left,
+                                       depth + 1,
+                                       node_id,
+                                       True, 
+                                       value_left,
+                                       stats_left,))
+            self._push(heap, counter, (idx_right,
+                                       depth + 1,
+                                       node_id,
+                                       False, 
+                                       value_right,
+                                       stats_right,))
             
             max_split_nodes -= 1
+
+    @staticmethod
+    def _push(heap, counter, item):
+        value = item[4]
+        if value is None or np.isnan(value):
+            priority = -np.inf
+        else:
+            priority = -value
+        heapq.heappush(heap, (priority, next(counter), item))
+
+
+def fit_tree(X, y, w, groups, n_groups,
+             params, criterion_cls, splitter_cls,
+             random_state, n_jobs=None) -> Tree:
+    criterion = criterion_cls(groups)
+
+    # A root that cannot be split is stored directly, without initializing
+    # the splitter. Under delta-delta-p a constant target has zero uplift
+    # everywhere, so no split can have a positive gain either.
+    if (X.shape[0] < params.min_samples_split
+        or (isinstance(criterion, DeltaDeltaP) and np.all(y == y[0]))):
+        tree = Tree(n_groups=n_groups)
+        tree.add_node(None, True, True,
+                      criterion.value(y, w), None, (None, None),
+                      group_stats(y, w, groups))
+        return tree
+
+    splitter = splitter_cls(criterion,
+                            params.min_samples_leaf,
+                            params.min_samples_leaf_treated,
+                            params.min_samples_leaf_control,
+                            params.max_features,
+                            random_state,
+                            n_jobs)
+
+    if params.max_leaf_nodes < 0:
+        builder = DepthFirstTreeBuilder(splitter,
+                                        params.max_depth,
+                                        params.min_samples_split,
+                                        params.min_samples_leaf,
+                                        params.min_samples_leaf_treated,
+                                        params.min_samples_leaf_control,)
+    else:
+        builder = BestFirstTreeBuilder(splitter,
+                                       params.max_depth,
+                                       params.min_samples_split,
+                                       params.min_samples_leaf,
+                                       params.min_samples_leaf_treated,
+                                       params.min_samples_leaf_control,
+                                       params.max_leaf_nodes,)
+
+    tree = Tree(n_groups=n_groups)
+    builder.build(tree, X, y, w, groups)
+
+    return tree
@@ -20,3 +20,43 @@ def group_stats(y, w, groups):
         nts.append(ng)
 
     return tuple(nts), nc, tuple(uts)
+
+
+class QuantileBinner:
+    def __init__(self, n_bins=255):
+        self.n_bins = n_bins
+
+    def fit(self, X):
+        quantiles = np.linspace(0, 100, self.n_bins + 1)[1:]
+
+        self.bin_edges_ = list()
+        for i in range(X.shape[1]):
+            values = X[:, i][~np.isnan(X[:, i])]
+            if len(values) == 0:
+                edges = np.array([np.inf])
+            else:
+                # Edges are taken from the data so that thresholds mapped
+                # back from bins compare the same way in X's own dtype.
+                edges = np.unique(values)
+                if len(edges) > self.n_bins:
+                    edges = np.unique(np.percentile(values, quantiles,
+                                                    method='lower'))
+            self.bin_edges_.append(edges)
+
+        return self
+
+    def transform(self, X):
+        # Bin indices are small integers stored as floats so that missing
+        # values keep flowing through the splitters as NaN.
+        Xb = np.empty(X.shape, dtype=np.float32, order='F')
+        for i, edges in enumerate(self.bin_edges_):
+            Xb[:, i] = np.searchsorted(edges, X[:, i], side='left')
+            Xb[np.isnan(X[:, i]), i] = np.nan
+
+        return Xb
+
+    def threshold(self, feature, threshold):
+        # ``bin(x) <= t`` holds exactly when ``x <= edges[floor(t)]``.
+        if np.isnan(threshold):
+            return threshold
+        return float(self.bin_edges_[feature][int(np.floor(threshold))])
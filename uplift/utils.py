@@ -15,3 +15,11 @@ def check_w(w):
         raise ValueError('Groups in the treatment vector must be in sequential order')
 
     return w, sorted(groups[groups != 0].tolist())
+
+
+def check_random_state(seed):
+    from sklearn.utils import check_random_state as _check_random_state
+
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return _check_random_state(seed)